@@ -0,0 +1,186 @@
+"""
+Admission control for the API routes.
+
+Each route can carry per-user and global token buckets, and every decorated route takes a slot
+from a bounded in-flight counter sized to the database pool. When a bucket is empty the request
+gets a 429, and when no slot frees up in time it gets a 503; both come with Retry-After so clients
+back off instead of piling onto the pool. Lower priority traffic (chat polling, bulk exports) may
+only use part of the capacity and never waits, so page loads keep working during a spike.
+
+State is per process and counts the requests running on that process's threads, so it needs a
+threaded worker class: the Procfile and Dockerfile run gunicorn with gthread workers, and the
+in-flight limit defaults to the smaller of the thread count and the pool size. Under sync workers
+each process serves one request at a time and the in-flight limit never engages. With several
+workers each enforces its own limits.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from flask import Response, jsonify, request, session
+from sqlalchemy import event
+
+# Share of the in-flight capacity each priority may use, and how long it may wait for a slot
+PRIORITIES = {
+    "read": (1.0, 0.5),
+    "write": (0.8, 0.2),
+    "poll": (0.5, 0.0),
+}
+
+MAX_TRACKED_BUCKETS = 10000
+BUSY_RETRY_AFTER = 2  # Seconds
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """Take a token, returning 0 on success or the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_idle(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class AdmissionControl:
+    def __init__(self, engine, max_in_flight, pool_capacity, enabled=True):
+        self.engine = engine
+        self.max_in_flight = max_in_flight
+        self.pool_capacity = pool_capacity
+        self.enabled = enabled
+        # Re-entrant because the pool checkin listener can fire on any thread, even one holding the lock
+        self.lock = threading.RLock()
+        self.slots = threading.Condition(self.lock)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.buckets = {}
+        self.counters = defaultdict(lambda: defaultdict(int))
+
+        # Requests waiting on a saturated pool need waking when a connection comes back, not only on release()
+        event.listen(engine, "checkin", self.pool_checkin)
+
+    def limit(self, priority, per_user=None, total=None):
+        """Decorate a route with admission control.
+
+        `per_user` and `total` are optional (requests per second, burst) token bucket limits.
+        """
+        share, max_wait = PRIORITIES[priority]
+
+        def decorator(f):
+            route = f.__name__
+
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+
+                retry_after = self.take_tokens(route, per_user, total)
+                if retry_after:
+                    return self.reject(route, "rate_limited", 429, "Too many requests", retry_after)
+                if not self.acquire(route, share, max_wait, priority == "read"):
+                    return self.reject(route, "shed", 503, "Server busy, please retry", BUSY_RETRY_AFTER)
+
+                try:
+                    response = f(*args, **kwargs)
+                except BaseException:
+                    self.release()
+                    raise
+
+                if isinstance(response, Response) and response.is_streamed:
+                    # The body is generated after the view returns, so hold the slot until it is closed
+                    response.call_on_close(self.release)
+                else:
+                    self.release()
+                return response
+            return wrapper
+        return decorator
+
+    def take_tokens(self, route, per_user, total):
+        now = time.monotonic()
+        user = (session.get('user') or {}).get('email') or request.remote_addr
+        limits = []
+        if per_user:
+            limits.append(((route, user), per_user))
+        if total:
+            limits.append(((route, None), total))
+
+        with self.lock:
+            if len(self.buckets) > MAX_TRACKED_BUCKETS:
+                # Full buckets behave exactly like new ones, so they are safe to forget
+                self.buckets = {key: b for key, b in self.buckets.items() if not b.is_idle(now)}
+
+            retry_after = 0
+            for key, (rate, burst) in limits:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = TokenBucket(rate, burst, now)
+                retry_after = max(retry_after, bucket.take(now))
+            return retry_after
+
+    def pool_saturated(self):
+        return self.engine.pool.checkedout() >= self.pool_capacity
+
+    def acquire(self, route, share, max_wait, ignore_pool):
+        limit = max(1, int(self.max_in_flight * share))
+        started = time.monotonic()
+        deadline = started + max_wait
+        queued = False
+
+        with self.slots:
+            while self.in_flight >= limit or (not ignore_pool and self.pool_saturated()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if not queued:
+                    queued = True
+                    self.counters[route]["queued"] += 1
+                self.slots.wait(remaining)
+
+            if queued:
+                self.counters[route]["queue_wait_ms"] += int((time.monotonic() - started) * 1000)
+            self.counters[route]["admitted"] += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def release(self):
+        with self.slots:
+            self.in_flight -= 1
+            # Waiters have different priorities and limits, so wake them all to re-check
+            self.slots.notify_all()
+
+    def pool_checkin(self, dbapi_connection, connection_record):
+        with self.slots:
+            self.slots.notify_all()
+
+    def reject(self, route, reason, status, message, retry_after):
+        with self.lock:
+            self.counters[route][reason] += 1
+        response = jsonify({"error": message})
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return response, status
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "max_in_flight": self.max_in_flight,
+                "pool_checked_out": self.engine.pool.checkedout(),
+                "pool_capacity": self.pool_capacity,
+                "routes": {route: dict(counts) for route, counts in self.counters.items()}
+            }
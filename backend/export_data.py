@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Stream orders (with their items nested) or chat messages out of the database as NDJSON or CSV.
+Rows are read through a server-side cursor in fixed-size chunks, so memory use stays flat no
+matter how large the tables are. Every row carries its id: pass the last one you received as
+--after to resume an interrupted export.
+
+    python export_data.py orders --format csv --from 2025-01-01 --to 2025-03-31 > orders.csv
+    python export_data.py messages --region 53.3,-1.6,53.5,-1.3 --after 48210 >> messages.ndjson
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import Float, cast, func, select
+from models import engine, Order, OrderItem, Message
+
+CHUNK_SIZE = 1000
+EXPORT_TABLES = ("orders", "messages")
+EXPORT_FORMATS = ("ndjson", "csv")
+
+ORDER_FIELDS = ["id", "account_id", "message", "lat", "lng", "address",
+                "collectionTime", "collectionDate", "fulfilled", "created_at", "claimed_at", "opened_at", "items"]
+MESSAGE_FIELDS = ["id", "order_id", "sender_email", "content", "timestamp"]
+
+
+def parse_region(value):
+    """Parse a "min_lat,min_lng,max_lat,max_lng" bounding box."""
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("region must be min_lat,min_lng,max_lat,max_lng")
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def parse_date(value):
+    """Validate a YYYY-MM-DD date, returning it unchanged."""
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"invalid date '{value}', expected YYYY-MM-DD")
+    return value
+
+
+def in_region(table, region):
+    min_lat, min_lng, max_lat, max_lng = region
+    return (
+        cast(table.c.lat, Float).between(min_lat, max_lat) &
+        cast(table.c.lng, Float).between(min_lng, max_lng)
+    )
+
+
+def build_orders_query(date_from=None, date_to=None, region=None, after=0):
+    orders = Order.__table__
+    # Filter on the day the order was made; older rows without created_at fall back to the collection date
+    day = func.coalesce(func.substr(orders.c.created_at, 1, 10), orders.c.collectionDate)
+    query = select(orders).where(orders.c.id > after).order_by(orders.c.id)
+    if date_from:
+        query = query.where(day >= date_from)
+    if date_to:
+        query = query.where(day <= date_to)
+    if region:
+        query = query.where(in_region(orders, region))
+    return query
+
+
+def build_messages_query(date_from=None, date_to=None, region=None, after=0):
+    messages = Message.__table__
+    query = select(messages).where(messages.c.id > after).order_by(messages.c.id)
+    if date_from:
+        query = query.where(messages.c.timestamp >= date_from)
+    if date_to:
+        # Timestamps are ISO strings, so include everything before the following day
+        next_day = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat()
+        query = query.where(messages.c.timestamp < next_day)
+    if region:
+        orders = Order.__table__
+        query = query.where(messages.c.order_id.in_(select(orders.c.id).where(in_region(orders, region))))
+    return query
+
+
+def iter_rows(conn, table, **filters):
+    """Yield export rows as dicts, one server-side chunk at a time."""
+    query = build_orders_query(**filters) if table == "orders" else build_messages_query(**filters)
+    result = conn.execution_options(stream_results=True, yield_per=CHUNK_SIZE).execute(query)
+
+    for chunk in result.partitions():
+        rows = [dict(row._mapping) for row in chunk]
+        if table == "orders":
+            # One item query per chunk keeps nesting cheap without holding every item in memory
+            items = {row["id"]: [] for row in rows}
+            item_rows = conn.execute(
+                select(OrderItem.__table__)
+                .where(OrderItem.__table__.c.order_id.in_(items.keys()))
+                .order_by(OrderItem.__table__.c.item_id)
+            )
+            for item in item_rows:
+                items[item.order_id].append({"name": item.name, "quantity": item.quantity})
+            for row in rows:
+                row["items"] = items[row["id"]]
+        yield from rows
+
+
+def iter_export(table, fmt="ndjson", **filters):
+    """Yield (row id, text line) pairs, holding one database connection for the duration.
+
+    The CSV header is yielded first with a row id of None.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"table must be one of {', '.join(EXPORT_TABLES)}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    fields = ORDER_FIELDS if table == "orders" else MESSAGE_FIELDS
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, lineterminator="\n")
+
+    def csv_line(row):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+
+    if fmt == "csv":
+        yield None, csv_line({field: field for field in fields})
+
+    with engine.connect() as conn:
+        for row in iter_rows(conn, table, **filters):
+            if fmt == "csv":
+                if "items" in row:
+                    row["items"] = json.dumps(row["items"])
+                yield row["id"], csv_line(row)
+            else:
+                yield row["id"], json.dumps(row) + "\n"
+
+
+def export_lines(table, fmt="ndjson", **filters):
+    for _, line in iter_export(table, fmt, **filters):
+        yield line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream orders or messages as NDJSON or CSV.")
+    parser.add_argument("table", choices=EXPORT_TABLES)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--from", dest="date_from", type=parse_date, help="earliest date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", type=parse_date, help="latest date, YYYY-MM-DD")
+    parser.add_argument("--region", type=parse_region, help="bounding box min_lat,min_lng,max_lat,max_lng")
+    parser.add_argument("--after", type=int, default=0, help="resume after this row id")
+    args = parser.parse_args()
+
+    count = 0
+    last_id = args.after
+    try:
+        for row_id, line in iter_export(args.table, args.format, date_from=args.date_from, date_to=args.date_to,
+                                        region=args.region, after=args.after):
+            sys.stdout.write(line)
+            if row_id is not None:
+                count += 1
+                last_id = row_id
+    finally:
+        print(f"Exported {count} {args.table}, last id {last_id} (resume with --after {last_id})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
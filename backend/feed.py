@@ -0,0 +1,42 @@
+"""
+Change feed behind /requests?since=<version>.
+
+Every write that adds an order to or removes one from the open set records an OrderChange in the
+same transaction. Versions come from the single-row OrderFeed counter; bumping it locks the row
+until commit, so concurrent writers commit in version order and a client never skips a version
+that was still in flight.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+from models import OrderChange, OrderFeed, upsert
+
+
+def record_order_changes(db, order_ids, kind):
+    # Call this before the stats hooks so every write takes the locks in the same order
+    if not order_ids:
+        return
+    latest = db.execute(
+        upsert(OrderFeed, {"id": 1, "version": len(order_ids)}, ["id"], {"version": OrderFeed.version + len(order_ids)})
+        .returning(OrderFeed.version)
+    ).scalar_one()
+    now = datetime.now().isoformat()
+    first = latest - len(order_ids) + 1
+    db.execute(insert(OrderChange).values([
+        {"version": first + i, "order_id": order_id, "kind": kind, "timestamp": now}
+        for i, order_id in enumerate(order_ids)
+    ]))
+
+
+def prune_order_changes(db, retention_days):
+    # Always keep the newest row so the retained range stays contiguous with the current version
+    cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+    newest = db.query(func.max(OrderChange.version)).scalar_subquery()
+    db.query(OrderChange).filter(
+        OrderChange.timestamp < cutoff,
+        OrderChange.version < newest
+    ).delete(synchronize_session=False)
+
+
+def current_feed_version(db):
+    return db.query(OrderFeed.version).filter_by(id=1).scalar() or 0
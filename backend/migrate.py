@@ -1,15 +1,44 @@
 #!/usr/bin/env python
-"""Add collectionDate column to order table if it doesn't exist"""
+"""Bring existing tables up to date with models.py (new tables are created by models.py itself)"""
 from sqlalchemy import text
 from models import engine
 
-with engine.connect() as conn:
-    try:
-        conn.execute(text('ALTER TABLE "order" ADD COLUMN "collectionDate" VARCHAR'))
-        conn.commit()
-        print("Column 'collectionDate' added successfully!")
-    except Exception as e:
-        if 'already exists' in str(e).lower() or 'duplicate column' in str(e).lower():
-            print("Column 'collectionDate' already exists, skipping.")
-        else:
-            print(f"Error: {e}")
+COLUMNS = [
+    ("order", "collectionDate", "VARCHAR"),
+    ("order", "created_at", "VARCHAR"),
+    ("order", "claimed_at", "VARCHAR"),
+    ("order", "opened_at", "VARCHAR"),
+    ("order_change", "version", "INTEGER"),
+    ("demand_cell", "timed_claims", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+# Columns the models no longer write; NOT NULL without a server default, so inserts fail while they exist
+REMOVED_COLUMNS = [
+    ("demand_cell", "opened"),
+    ("demand_cell", "closed"),
+]
+
+for table, name, column_type in COLUMNS:
+    # Separate connections so a failed ALTER doesn't abort the next one on PostgreSQL
+    with engine.connect() as conn:
+        try:
+            conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {column_type}'))
+            conn.commit()
+            print(f"Column '{table}.{name}' added successfully!")
+        except Exception as e:
+            if 'already exists' in str(e).lower() or 'duplicate column' in str(e).lower():
+                print(f"Column '{table}.{name}' already exists, skipping.")
+            else:
+                print(f"Error: {e}")
+
+for table, name in REMOVED_COLUMNS:
+    with engine.connect() as conn:
+        try:
+            conn.execute(text(f'ALTER TABLE "{table}" DROP COLUMN "{name}"'))
+            conn.commit()
+            print(f"Column '{table}.{name}' dropped.")
+        except Exception as e:
+            if 'no such column' in str(e).lower() or 'does not exist' in str(e).lower():
+                print(f"Column '{table}.{name}' already gone, skipping.")
+            else:
+                print(f"Error: {e}")
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, UniqueConstraint
+from sqlalchemy.dialects import postgresql, sqlite
 import os
 
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///neighbourly.db')
@@ -7,15 +8,28 @@ if DATABASE_URL.startswith('postgres://'):
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
 # Use connection pooling to avoid connection overhead on every request
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
 engine = create_engine(
     DATABASE_URL,
-    pool_size=5,
-    max_overflow=10,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
     pool_pre_ping=True,  # Verify connections before using
     pool_recycle=300  # Recycle connections every 5 minutes
 )
 
-__all__ = ['Base', 'Account', 'Order', 'OrderItem', 'Message', 'engine', 'DATABASE_URL']
+__all__ = ['Base', 'Account', 'Order', 'OrderItem', 'Message', 'OrderChange', 'OrderFeed', 'ChatReadState', 'DemandCell', 'DemandOpen', 'DemandItem', 'engine', 'dialect_insert', 'upsert', 'DATABASE_URL', 'POOL_SIZE', 'MAX_OVERFLOW']
+
+
+def dialect_insert(model):
+    """INSERT supporting ON CONFLICT, for PostgreSQL or SQLite."""
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def upsert(model, values, conflict, set_):
+    """INSERT ... ON CONFLICT (conflict) DO UPDATE SET set_ for a single row."""
+    return dialect_insert(model).values(**values).on_conflict_do_update(index_elements=conflict, set_=set_)
 
 
 class Base(DeclarativeBase):
@@ -39,6 +53,9 @@ class Order(Base):
     collectionTime: Mapped[str] = mapped_column(nullable=False)
     collectionDate: Mapped[str] = mapped_column(nullable=True)  # Format: YYYY-MM-DD
     fulfilled: Mapped[int] = mapped_column(nullable=True)
+    created_at: Mapped[str] = mapped_column(nullable=True)  # ISO timestamp
+    claimed_at: Mapped[str] = mapped_column(nullable=True)  # ISO timestamp of the current claim
+    opened_at: Mapped[str] = mapped_column(nullable=True)  # ISO timestamp it last became claimable (created or unclaimed)
 
 
 class OrderItem(Base):
@@ -58,4 +75,73 @@ class Message(Base):
     timestamp: Mapped[str] = mapped_column(nullable=False)
 
 
+class OrderChange(Base):
+    """Append-only feed of order changes; clients sync from the version (see OrderFeed)."""
+    __tablename__ = "order_change"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(nullable=True, index=True)
+    order_id: Mapped[int] = mapped_column(nullable=False, index=True)
+    kind: Mapped[str] = mapped_column(nullable=False)  # created, claimed, unclaimed or removed
+    timestamp: Mapped[str] = mapped_column(nullable=False, index=True)
+
+
+class OrderFeed(Base):
+    """Single-row counter that hands out change feed versions.
+
+    Writers bump it inside their transaction, which holds the row lock until commit, so versions
+    become visible in the order they were assigned and a client never skips past one still in flight.
+    """
+    __tablename__ = "order_feed"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(nullable=False, default=0)
+
+
+class ChatReadState(Base):
+    """Read cursor and unread counter for one participant of an order's chat."""
+    __tablename__ = "chat_read_state"
+    __table_args__ = (UniqueConstraint("order_id", "account_id"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    order_id: Mapped[int] = mapped_column(nullable=False)
+    account_id: Mapped[int] = mapped_column(nullable=False, index=True)
+    last_read_message_id: Mapped[int] = mapped_column(nullable=True)
+    unread_count: Mapped[int] = mapped_column(nullable=False, default=0)
+
+
+class DemandCell(Base):
+    """Request activity per grid cell and day, kept current as orders change (see stats.py)."""
+    __tablename__ = "demand_cell"
+    __table_args__ = (UniqueConstraint("cell_x", "cell_y", "day"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    cell_x: Mapped[int] = mapped_column(nullable=False)
+    cell_y: Mapped[int] = mapped_column(nullable=False)
+    day: Mapped[str] = mapped_column(nullable=False)  # Format: YYYY-MM-DD
+    created: Mapped[int] = mapped_column(nullable=False, default=0)
+    claimed: Mapped[int] = mapped_column(nullable=False, default=0)
+    completed: Mapped[int] = mapped_column(nullable=False, default=0)
+    timed_claims: Mapped[int] = mapped_column(nullable=False, default=0)  # Claims whose wait is known
+    claim_seconds: Mapped[int] = mapped_column(nullable=False, default=0)  # Total wait of those claims, from when the order was last opened
+
+
+class DemandOpen(Base):
+    """Unclaimed requests per grid cell and collection date, so expired ones drop out at read time (see stats.py)."""
+    __tablename__ = "demand_open"
+    __table_args__ = (UniqueConstraint("cell_x", "cell_y", "collection_date"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    cell_x: Mapped[int] = mapped_column(nullable=False)
+    cell_y: Mapped[int] = mapped_column(nullable=False)
+    collection_date: Mapped[str] = mapped_column(nullable=False)  # Format: YYYY-MM-DD, or "" for orders without one
+    open_count: Mapped[int] = mapped_column(nullable=False, default=0)
+
+
+class DemandItem(Base):
+    """Requested item totals per day, kept current as orders are created (see stats.py)."""
+    __tablename__ = "demand_item"
+    __table_args__ = (UniqueConstraint("name", "day"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(nullable=False)
+    day: Mapped[str] = mapped_column(nullable=False)  # Format: YYYY-MM-DD
+    requests: Mapped[int] = mapped_column(nullable=False, default=0)
+    quantity: Mapped[int] = mapped_column(nullable=False, default=0)
+
+
 Base.metadata.create_all(engine)
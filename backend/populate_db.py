@@ -7,6 +7,8 @@ import random
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from models import engine, Account, Order, OrderItem
+from feed import record_order_changes
+import stats
 
 # UK cities with approximate coordinates
 UK_LOCATIONS = [
@@ -185,6 +187,7 @@ def populate_database(num_requests=100):
             items = generate_random_items()
             
             # Create order
+            now = datetime.now().isoformat()
             order = Order(
                 message=message,
                 account_id=demo_account.id,
@@ -193,11 +196,12 @@ def populate_database(num_requests=100):
                 address=address,
                 collectionTime=collection_time,
                 collectionDate=collection_date,
-                fulfilled=None
+                fulfilled=None,
+                created_at=now,
+                opened_at=now
             )
             db.add(order)
-            db.commit()
-            db.refresh(order)
+            db.flush()
             
             # Add items
             for item in items:
@@ -207,6 +211,9 @@ def populate_database(num_requests=100):
                     quantity=item["quantity"]
                 )
                 db.add(order_item)
+            # Same bookkeeping as /create-request, so open request pages pick the order up
+            record_order_changes(db, [order.id], "created")
+            stats.record_created(db, [order], {order.id: items})
             
             db.commit()
             
@@ -0,0 +1,198 @@
+"""
+Opt-in sampling profiler for production.
+
+With PROFILE_SAMPLE_RATE above zero, that fraction of requests runs under cProfile. Each sample
+records where its wall time went:
+
+    sql            executing statements on the app's engine (cursor events)
+    orm            hydrating rows into ORM objects (sqlalchemy.orm.loading.instances)
+    serialization  json.dumps, which jsonify and the routes both go through
+    session        loading and saving the Flask-Session row
+    python         everything else
+
+The profiler is paused while Flask-Session runs, so its own ORM loads count only under session
+and its internals are left out of the call stacks. A sample ends when the server closes the
+response rather than when the view returns, so streamed bodies (e.g. /admin/export) are covered.
+
+Timings and merged call-stack profiles are aggregated per endpoint, served by /admin/profiles and,
+if PROFILE_DIR is set, written there as <endpoint>.prof (readable with pstats or snakeviz) plus
+summary.json. When sampling is off nothing is installed, so there is no overhead.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+
+from sqlalchemy import event
+from werkzeug.wsgi import ClosingIterator
+
+PHASES = ("sql", "orm", "serialization", "session", "python")
+
+# (file suffix, function name) whose cumulative time counts towards a phase
+CUMULATIVE_PHASES = {
+    "orm": (os.path.join("sqlalchemy", "orm", "loading.py"), "instances"),
+    "serialization": (os.path.join("json", "__init__.py"), "dumps"),
+}
+
+
+class EndpointProfile:
+    def __init__(self):
+        self.samples = 0
+        self.total_ms = 0.0
+        self.phase_ms = dict.fromkeys(PHASES, 0.0)
+        self.stats = None
+
+    def summary(self):
+        return {
+            "samples": self.samples,
+            "mean_ms": round(self.total_ms / self.samples, 2) if self.samples else 0,
+            "phases_ms": {phase: round(ms / self.samples, 2) for phase, ms in self.phase_ms.items()} if self.samples else {},
+            "phases_pct": {phase: round(100 * ms / self.total_ms, 1) for phase, ms in self.phase_ms.items()} if self.total_ms else {}
+        }
+
+
+class SamplingProfiler:
+    def __init__(self, app, engine, sample_rate, output_dir=None, flush_every=20):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.flush_every = flush_every
+        self.local = threading.local()
+        self.lock = threading.RLock()
+        self.endpoints = {}
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        self.wsgi_app = app.wsgi_app
+        app.wsgi_app = self
+        self.instrument_engine(engine)
+        self.instrument_session(app.session_interface)
+
+    @property
+    def sampling(self):
+        return getattr(self.local, "active", False)
+
+    def add_phase_time(self, phase, seconds):
+        if self.sampling:
+            self.local.phases[phase] += seconds
+
+    def instrument_engine(self, engine):
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if self.sampling:
+                conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info.get("profile_started")
+            if self.sampling and started:
+                self.add_phase_time("sql", time.perf_counter() - started.pop())
+
+    def instrument_session(self, interface):
+        def timed(method):
+            def wrapper(*args, **kwargs):
+                profile = self.local.profile if self.sampling else None
+                if profile:
+                    profile.disable()
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.add_phase_time("session", time.perf_counter() - started)
+                    if profile:
+                        try:
+                            profile.enable()
+                        except ValueError:
+                            pass  # Another sample took the profiler meanwhile (Python 3.12+); timings still hold
+            return wrapper
+
+        interface.open_session = timed(interface.open_session)
+        interface.save_session = timed(interface.save_session)
+
+    def __call__(self, environ, start_response):
+        if random.random() >= self.sample_rate:
+            return self.wsgi_app(environ, start_response)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already running (e.g. a concurrent sample on Python 3.12+)
+            return self.wsgi_app(environ, start_response)
+
+        self.local.active = True
+        self.local.profile = profile
+        phases = self.local.phases = dict.fromkeys(PHASES, 0.0)
+        endpoint = self.endpoint_for(environ)
+        started = time.perf_counter()
+
+        def finish():
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            self.local.active = False
+            self.local.profile = None
+            self.record(endpoint, profile, elapsed, phases)
+
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            finish()
+            raise
+        # Streamed bodies are generated while the server iterates, so keep sampling until it closes them
+        return ClosingIterator(body, finish)
+
+    def endpoint_for(self, environ):
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+            return rule.endpoint
+        except Exception:
+            return "unmatched"
+
+    def record(self, endpoint, profile, elapsed, phases):
+        stats = pstats.Stats(profile)
+        for phase, (suffix, name) in CUMULATIVE_PHASES.items():
+            for (filename, _, function), (_, _, _, cumulative, _) in stats.stats.items():
+                if function == name and filename.endswith(suffix):
+                    phases[phase] += cumulative
+        phases["python"] = max(0.0, elapsed - sum(phases[p] for p in PHASES if p != "python"))
+
+        with self.lock:
+            entry = self.endpoints.setdefault(endpoint, EndpointProfile())
+            entry.samples += 1
+            entry.total_ms += elapsed * 1000
+            for phase in PHASES:
+                entry.phase_ms[phase] += phases[phase] * 1000
+            if entry.stats is None:
+                entry.stats = stats
+            else:
+                entry.stats.add(stats)
+            if self.output_dir and entry.samples % self.flush_every == 0:
+                self.flush(endpoint, entry)
+
+    def flush(self, endpoint, entry):
+        entry.stats.dump_stats(os.path.join(self.output_dir, f"{endpoint}.prof"))
+        with open(os.path.join(self.output_dir, "summary.json"), "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "endpoints": {endpoint: entry.summary() for endpoint, entry in self.endpoints.items()}
+            }
+
+    def top_functions(self, endpoint, limit=40, sort="cumulative"):
+        """Text report of the hottest functions for an endpoint, or None if it has no samples."""
+        with self.lock:
+            entry = self.endpoints.get(endpoint)
+            if entry is None:
+                return None
+            out = io.StringIO()
+            entry.stats.stream = out
+            entry.stats.sort_stats(sort).print_stats(limit)
+            return out.getvalue()
@@ -3,13 +3,19 @@ from os import environ as env
 from urllib.parse import quote_plus, urlencode
 from datetime import datetime
 
-from flask import Flask, redirect, session, request, url_for, jsonify
+from flask import Flask, Response, redirect, session, request, url_for, jsonify, stream_with_context
 from flask_cors import CORS, cross_origin
 from flask_session import Session as FlaskSession
 from authlib.integrations.flask_client import OAuth
 from dotenv import find_dotenv, load_dotenv
+from sqlalchemy import case, delete, func, or_, update
 from sqlalchemy.orm import Session
-from models import Order, OrderItem, Account, Message, engine, DATABASE_URL
+from models import Order, OrderItem, Account, Message, OrderChange, ChatReadState, engine, upsert, DATABASE_URL, POOL_SIZE, MAX_OVERFLOW
+from feed import record_order_changes, prune_order_changes, current_feed_version
+from admission import AdmissionControl
+from profiling import SamplingProfiler
+from export_data import EXPORT_TABLES, EXPORT_FORMATS, export_lines, parse_date, parse_region
+import stats
 
 ENV_FILE = find_dotenv()
 if ENV_FILE:
@@ -28,6 +34,8 @@ app.config['SESSION_SQLALCHEMY_TABLE'] = 'sessions'
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SESSION_COOKIE_SAMESITE'] = 'None'
 app.config['SESSION_COOKIE_SECURE'] = True  # Required for SameSite=None
+# Let the frontend read Retry-After on shed (429/503) responses so it can back off
+app.config['CORS_EXPOSE_HEADERS'] = ['Retry-After']
 
 # Import Flask-SQLAlchemy and configure session to use it
 from flask_sqlalchemy import SQLAlchemy
@@ -37,6 +45,9 @@ FlaskSession(app)
 
 FRONTEND_URL = env.get("FRONTEND_URL", "http://localhost:5173")
 
+# Accounts allowed to use the /admin routes
+ADMIN_EMAILS = {email.strip() for email in env.get("ADMIN_EMAILS", "").split(",") if email.strip()}
+
 CORS(app, supports_credentials=True, origins=[
     "http://localhost:5173",
     "http://localhost:5174",
@@ -82,8 +93,265 @@ def is_authorized():
     return True
 
 
+def is_admin():
+    return get_user_email() in ADMIN_EMAILS
+
+
+def get_current_account(db):
+    return db.query(Account).filter_by(email=get_user_email()).first()
+
+
+# Query helpers shared by the page routes and /bootstrap
+def load_items_by_order(db, order_ids):
+    """Fetch the items for many orders in a single query, keyed by order id."""
+    items = {order_id: [] for order_id in order_ids}
+    if order_ids:
+        rows = db.query(OrderItem).filter(OrderItem.order_id.in_(order_ids)).order_by(OrderItem.item_id).all()
+        for item in rows:
+            items[item.order_id].append({"name": item.name, "quantity": item.quantity})
+    return items
+
+
+def load_open_orders(db):
+    # Unfulfilled orders that haven't expired (date >= today or no date set)
+    today = datetime.now().strftime("%Y-%m-%d")
+    return db.query(Order).filter(
+        Order.fulfilled == None,
+        or_(Order.collectionDate == None, Order.collectionDate == "", Order.collectionDate >= today)
+    ).all()
+
+
+def is_open_order(order):
+    today = datetime.now().strftime("%Y-%m-%d")
+    return order.fulfilled is None and (not order.collectionDate or order.collectionDate >= today)
+
+
+def serialize_request_list(orders, items, include_id_as="order_id"):
+    result = []
+    for order in orders:
+        entry = {
+            include_id_as: order.id,
+            "message": order.message,
+            "account_id": order.account_id,
+            "lat": order.lat,
+            "lng": order.lng,
+            "fulfilled": order.fulfilled,
+            "items": items.get(order.id, []),
+            "time": order.collectionTime,
+            "date": order.collectionDate,
+            "address": order.address
+        }
+        if include_id_as == "id":
+            entry["id"] = order.id
+        result.append(entry)
+    return result
+
+
+def serialize_personal_order(order, items):
+    return {
+        "id": order.id,
+        "message": order.message,
+        "account_id": order.account_id,
+        "lat": order.lat,
+        "lng": order.lng,
+        "address": order.address,
+        "collectionTime": order.collectionTime,
+        "collectionDate": order.collectionDate,
+        "items": items.get(order.id, []),
+        "fulfilled": order.fulfilled,
+    }
+
+
+def load_commitments(db, user):
+    orders = db.query(Order).filter_by(fulfilled=user.id).all()
+    items = load_items_by_order(db, [o.id for o in orders])
+    requester_ids = {o.account_id for o in orders}
+    requesters = {a.id: a for a in db.query(Account).filter(Account.id.in_(requester_ids)).all()} if requester_ids else {}
+
+    result = []
+    for order in orders:
+        requester = requesters.get(order.account_id)
+        result.append({
+            "id": order.id,
+            "message": order.message,
+            "lat": order.lat,
+            "lng": order.lng,
+            "address": order.address,
+            "collectionTime": order.collectionTime,
+            "collectionDate": order.collectionDate,
+            "items": items.get(order.id, []),
+            "requester_email": requester.email if requester else "Unknown"
+        })
+    return result
+
+
+# Change feed reads for /requests?since=<version>
+def load_order_delta(db, since):
+    """Open orders that changed after `since`, plus ids that left the open set.
+
+    Falls back to a full resync when `since` is older than the retained feed.
+    """
+    version = current_feed_version(db)
+    oldest = db.query(func.min(OrderChange.version)).scalar() or 0
+
+    if since <= 0 or since > version or since < oldest - 1:
+        orders = load_open_orders(db)
+        items = load_items_by_order(db, [o.id for o in orders])
+        return {"version": version, "full": True, "orders": serialize_request_list(orders, items), "removed": []}
+
+    changed_ids = [row[0] for row in db.query(OrderChange.order_id).filter(
+        OrderChange.version > since,
+        OrderChange.version <= version
+    ).distinct()]
+    orders = db.query(Order).filter(Order.id.in_(changed_ids)).all() if changed_ids else []
+    open_orders = [o for o in orders if is_open_order(o)]
+    items = load_items_by_order(db, [o.id for o in open_orders])
+
+    return {
+        "version": version,
+        "full": False,
+        "orders": serialize_request_list(open_orders, items),
+        "removed": sorted(set(changed_ids) - {o.id for o in open_orders})
+    }
+
+
+# Request body helpers
+def parse_items(data):
+    """Items from a create request as {"name", "quantity"} dicts, or None if any is malformed."""
+    items = (data or {}).get("items", [])
+    if not isinstance(items, list):
+        return None
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        name, quantity = item.get("name"), item.get("quantity")
+        if not isinstance(name, str) or not name.strip():
+            return None
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            return None
+        parsed.append({"name": name, "quantity": quantity})
+    return parsed
+
+
+# Batch helpers
+def parse_order_ids(data):
+    """Deduplicated order ids from a batch request body, or None if it is malformed."""
+    order_ids = (data or {}).get("order_ids")
+    if not isinstance(order_ids, list) or not order_ids or len(order_ids) > MAX_BATCH_SIZE:
+        return None
+    if not all(isinstance(order_id, int) and not isinstance(order_id, bool) for order_id in order_ids):
+        return None
+    return list(dict.fromkeys(order_ids))
+
+
+def batch_results(order_ids, found, applied):
+    def status(order_id):
+        if order_id in applied:
+            return "ok"
+        return "conflict" if order_id in found else "not_found"
+
+    return [{"order_id": order_id, "status": status(order_id)} for order_id in order_ids]
+
+
+# Chat read state helpers
+def bump_unread(db, order_id, account_id):
+    db.execute(upsert(
+        ChatReadState, {"order_id": order_id, "account_id": account_id, "unread_count": 1},
+        ["order_id", "account_id"], {"unread_count": ChatReadState.unread_count + 1}
+    ))
+
+
+def mark_read_up_to(db, order_id, account_id, message_id):
+    db.execute(upsert(
+        ChatReadState, {"order_id": order_id, "account_id": account_id, "last_read_message_id": message_id, "unread_count": 0},
+        ["order_id", "account_id"], {"last_read_message_id": message_id, "unread_count": 0}
+    ))
+
+
+def reset_read_state(db, order_ids, helper_id):
+    """Forget the departing helper's cursor and clear the requester's unread count when a claim is released."""
+    db.execute(delete(ChatReadState).where(ChatReadState.order_id.in_(order_ids), ChatReadState.account_id == helper_id))
+    db.execute(update(ChatReadState).where(ChatReadState.order_id.in_(order_ids)).values(unread_count=0))
+
+
+def load_chat_summaries(db, user, email):
+    """Chats the user is part of, with the other participant, last message and unread count, in four queries."""
+    orders = db.query(Order).filter(
+        or_(
+            (Order.account_id == user.id) & (Order.fulfilled != None),
+            Order.fulfilled == user.id
+        )
+    ).order_by(Order.id).all()
+    if not orders:
+        return []
+
+    order_ids = [o.id for o in orders]
+    other_ids = {o.fulfilled if o.account_id == user.id else o.account_id for o in orders}
+    accounts = {a.id: a for a in db.query(Account).filter(Account.id.in_(other_ids)).all()}
+
+    latest_ids = db.query(func.max(Message.id)).filter(Message.order_id.in_(order_ids)).group_by(Message.order_id)
+    last_messages = {m.order_id: m for m in db.query(Message).filter(Message.id.in_(latest_ids)).all()}
+    unread = dict(db.query(ChatReadState.order_id, ChatReadState.unread_count).filter(
+        ChatReadState.account_id == user.id,
+        ChatReadState.order_id.in_(order_ids)
+    ).all())
+
+    # Requests I made come before the ones I'm helping with, as /my-chats always listed them
+    orders.sort(key=lambda o: o.account_id != user.id)
+
+    chats = []
+    for order in orders:
+        is_requester = order.account_id == user.id
+        other = accounts.get(order.fulfilled if is_requester else order.account_id)
+        last_msg = last_messages.get(order.id)
+        chats.append({
+            "order_id": order.id,
+            "role": "requester" if is_requester else "helper",
+            "other_user": {
+                "name": other.email.split('@')[0].title() if other else "Unknown",
+                "email": other.email if other else ""
+            },
+            "address": order.address,
+            "unread": unread.get(order.id, 0),
+            "last_message": {
+                "content": last_msg.content,
+                "timestamp": last_msg.timestamp,
+                "is_mine": last_msg.sender_email == email
+            } if last_msg else None
+        })
+    return chats
+
+
 BACKEND_URL = env.get("BACKEND_URL", "http://localhost:3000")
 
+# Most orders a single batch request may touch
+MAX_BATCH_SIZE = 100
+
+# How long removal tombstones stay in the change feed before clients need a full resync
+ORDER_CHANGE_RETENTION_DAYS = int(env.get("ORDER_CHANGE_RETENTION_DAYS", 7))
+
+# Threads per gunicorn worker (see Procfile/Dockerfile); the in-flight limit only engages with threaded workers
+WEB_THREADS = int(env.get("WEB_THREADS", 16))
+
+# Shed load with 429/503 before requests queue up on the database pool
+admission = AdmissionControl(
+    engine,
+    max_in_flight=int(env.get("ADMISSION_MAX_IN_FLIGHT", min(WEB_THREADS, POOL_SIZE + MAX_OVERFLOW))),
+    pool_capacity=POOL_SIZE + MAX_OVERFLOW,
+    enabled=env.get("ADMISSION_CONTROL", "true").lower() == "true"
+)
+
+# Opt-in sampling profiler; nothing is installed unless PROFILE_SAMPLE_RATE > 0
+PROFILE_SAMPLE_RATE = float(env.get("PROFILE_SAMPLE_RATE", 0))
+profiler = SamplingProfiler(
+    app,
+    engine,
+    sample_rate=PROFILE_SAMPLE_RATE,
+    output_dir=env.get("PROFILE_DIR"),
+    flush_every=int(env.get("PROFILE_FLUSH_EVERY", 20))
+) if PROFILE_SAMPLE_RATE > 0 else None
+
 
 # Health check route
 @app.route("/")
@@ -132,6 +400,63 @@ def check_auth():
     return jsonify({"authenticated": False})
 
 
+BOOTSTRAP_PAGES = ("makerequest", "viewrequest", "requests", "account")
+
+
+@app.route("/bootstrap")
+@cross_origin(supports_credentials=True)
+@admission.limit("read")
+def bootstrap():
+    """Everything a page needs on load, resolving the session and account only once."""
+    page = request.args.get("page")
+    if page not in BOOTSTRAP_PAGES:
+        return jsonify({"error": "Unknown page"}), 400
+
+    if not is_authorized():
+        return jsonify({"authenticated": False})
+
+    email = get_user_email()
+    user_info = session.get('user')
+    result = {
+        "authenticated": True,
+        "email": email,
+        "name": user_info.get('name', user_info.get('nickname', 'User')),
+        "picture": user_info.get('picture', '')
+    }
+
+    with Session(engine) as db:
+        user = get_current_account(db)
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        if page == "makerequest":
+            result["has_order"] = db.query(Order.id).filter_by(account_id=user.id).first() is not None
+
+        elif page == "viewrequest":
+            orders = db.query(Order).filter_by(account_id=user.id).all()
+            items = load_items_by_order(db, [o.id for o in orders])
+            result["has_order"] = bool(orders)
+            result["orders"] = [serialize_personal_order(order, items) for order in orders]
+            result["chats"] = load_chat_summaries(db, user, email)
+
+        elif page == "requests":
+            # Read the version first so changes racing this load are replayed on the next sync
+            result["version"] = current_feed_version(db)
+            unfulfilled = load_open_orders(db)
+            my_fulfilling = db.query(Order).filter_by(fulfilled=user.id).all()
+            items = load_items_by_order(db, [o.id for o in unfulfilled + my_fulfilling])
+            result["requests"] = [
+                serialize_request_list(my_fulfilling, items, "id"),
+                serialize_request_list(unfulfilled, items, "order_id")
+            ]
+
+        elif page == "account":
+            result["commitments"] = load_commitments(db, user)
+            result["chats"] = load_chat_summaries(db, user, email)
+
+    return jsonify(result)
+
+
 # Account routes
 @app.route("/account")
 @cross_origin(supports_credentials=True)
@@ -151,53 +476,31 @@ def get_account():
 # Request routes
 @app.route("/requests")
 @cross_origin(supports_credentials=True)
+@admission.limit("read")
 def get_requests():
     if not is_authorized():
         return redirect(url_for("login"))
     
-    email = get_user_email()
-    today = datetime.now().strftime("%Y-%m-%d")
-    
+    since = request.args.get("since", type=int)
+
     with Session(engine) as db:
-        user = db.query(Account).filter_by(email=email).first()
-        # Get unfulfilled orders that haven't expired (date >= today or no date set)
-        all_unfulfilled = db.query(Order).filter_by(fulfilled=None).all()
-        unfulfilled = [o for o in all_unfulfilled if not o.collectionDate or o.collectionDate >= today]
+        if since is not None:
+            return jsonify(load_order_delta(db, since))
+
+        user = get_current_account(db)
+        unfulfilled = load_open_orders(db)
         my_fulfilling = db.query(Order).filter_by(fulfilled=user.id).all()
-        all_items = db.query(OrderItem).all()
-
-        def build_order_list(orders, include_id_as="order_id"):
-            if not orders:
-                return [{"error": "No orders"}]
-            result = []
-            for order in orders:
-                items = [{"name": i.name, "quantity": i.quantity} 
-                        for i in all_items if i.order_id == order.id]
-                entry = {
-                    include_id_as: order.id,
-                    "message": order.message,
-                    "account_id": order.account_id,
-                    "lat": order.lat,
-                    "lng": order.lng,
-                    "fulfilled": order.fulfilled,
-                    "items": items,
-                    "time": order.collectionTime,
-                    "date": order.collectionDate,
-                    "address": order.address
-                }
-                if include_id_as == "id":
-                    entry["id"] = order.id
-                result.append(entry)
-            return result
-
-        my_list = build_order_list(my_fulfilling, "id")
-        unfulfilled_list = build_order_list(unfulfilled, "order_id")
-        
+        items = load_items_by_order(db, [o.id for o in unfulfilled + my_fulfilling])
+
+        my_list = serialize_request_list(my_fulfilling, items, "id") or [{"error": "No orders"}]
+        unfulfilled_list = serialize_request_list(unfulfilled, items, "order_id") or [{"error": "No orders"}]
+
         return json.dumps([my_list, unfulfilled_list])
 
 
 @app.route("/deliver-personal-order")
 @cross_origin(supports_credentials=True)
+@admission.limit("read")
 def get_my_orders():
     if not is_authorized():
         return redirect(url_for("login"))
@@ -212,26 +515,13 @@ def get_my_orders():
         if not orders:
             return json.dumps([{"error": "No orders"}])
 
-        result = []
-        for order in orders:
-            items = db.query(OrderItem).filter_by(order_id=order.id).all()
-            result.append({
-                "id": order.id,
-                "message": order.message,
-                "account_id": order.account_id,
-                "lat": order.lat,
-                "lng": order.lng,
-                "address": order.address,
-                "collectionTime": order.collectionTime,
-                "collectionDate": order.collectionDate,
-                "items": [{"name": i.name, "quantity": i.quantity} for i in items],
-                "fulfilled": order.fulfilled,
-            })
-        return json.dumps(result)
+        items = load_items_by_order(db, [o.id for o in orders])
+        return json.dumps([serialize_personal_order(order, items) for order in orders])
 
 
 @app.route("/check-order")
 @cross_origin(supports_credentials=True)
+@admission.limit("read")
 def check_order():
     if not is_authorized():
         return jsonify({"error": "Unauthorized"}), 401
@@ -247,11 +537,17 @@ def check_order():
 
 @app.route("/create-request", methods=["POST"])
 @cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(0.1, 3), total=(10, 20))
 def create_request():
     if not is_authorized():
         return redirect(url_for("login"))
     
     data = request.get_json()
+    items = parse_items(data)
+    if items is None:
+        return jsonify({"error": "items must each have a name and a positive whole quantity"}), 400
+
+    now = datetime.now().isoformat()
     with Session(engine) as db:
         user = db.query(Account).filter_by(email=get_user_email()).first()
         order = Order(
@@ -262,17 +558,22 @@ def create_request():
             address=data.get("address"),
             collectionTime=data.get("collectionTime"),
             collectionDate=data.get("collectionDate"),
-            fulfilled=None
+            fulfilled=None,
+            created_at=now,
+            opened_at=now
         )
         db.add(order)
-        db.commit()
+        db.flush()  # Assigns order.id; everything below commits together
 
-        for item in data.get("items", []):
+        for item in items:
             db.add(OrderItem(
                 order_id=order.id,
                 name=item['name'],
                 quantity=item['quantity']
             ))
+        record_order_changes(db, [order.id], "created")
+        prune_order_changes(db, ORDER_CHANGE_RETENTION_DAYS)
+        stats.record_created(db, [order], {order.id: items})
         db.commit()
 
     return jsonify({"success": True})
@@ -280,21 +581,38 @@ def create_request():
 
 @app.route("/fulfil-request", methods=["POST"])
 @cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(1, 10))
 def fulfil_request():
     if not is_authorized():
         return jsonify({"error": "Unauthorized"}), 401
     
     order_id = request.get_json().get("order_id")
+    now = datetime.now().isoformat()
     with Session(engine) as db:
         user = db.query(Account).filter_by(email=get_user_email()).first()
         order = db.query(Order).filter_by(id=order_id).first()
-        order.fulfilled = user.id
+        if not order:
+            return jsonify({"error": "Order not found"}), 404
+
+        # The fulfilled check in the UPDATE stops two helpers claiming the same order
+        claimed = db.execute(
+            update(Order)
+            .where(Order.id == order.id, Order.fulfilled == None)
+            .values(fulfilled=user.id, claimed_at=now)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if not claimed:
+            return jsonify({"error": "Already claimed"}), 409
+        record_order_changes(db, [order.id], "claimed")
+        stats.record_claimed(db, [order], now)
         db.commit()
     return jsonify({"success": True, "order_id": order_id})
 
 
 @app.route("/my-commitments")
 @cross_origin(supports_credentials=True)
+@admission.limit("read")
 def get_commitments():
     if not is_authorized():
         return jsonify({"error": "Unauthorized"}), 401
@@ -305,46 +623,43 @@ def get_commitments():
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        orders = db.query(Order).filter_by(fulfilled=user.id).all()
-        result = []
-        for order in orders:
-            items = db.query(OrderItem).filter_by(order_id=order.id).all()
-            requester = db.query(Account).filter_by(id=order.account_id).first()
-            result.append({
-                "id": order.id,
-                "message": order.message,
-                "lat": order.lat,
-                "lng": order.lng,
-                "address": order.address,
-                "collectionTime": order.collectionTime,
-                "collectionDate": order.collectionDate,
-                "items": [{"name": i.name, "quantity": i.quantity} for i in items],
-                "requester_email": requester.email if requester else "Unknown"
-            })
-        return jsonify(result)
+        return jsonify(load_commitments(db, user))
 
 
 @app.route("/unfulfil-request", methods=["POST"])
 @cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(1, 10))
 def unfulfil_request():
     if not is_authorized():
         return jsonify({"error": "Unauthorized"}), 401
     
     order_id = request.get_json().get("order_id")
+    now = datetime.now().isoformat()
     with Session(engine) as db:
         user = db.query(Account).filter_by(email=get_user_email()).first()
         order = db.query(Order).filter_by(id=order_id).first()
         if not order:
             return jsonify({"error": "Order not found"}), 404
-        if order.fulfilled != user.id:
+
+        released = db.execute(
+            update(Order)
+            .where(Order.id == order.id, Order.fulfilled == user.id)
+            .values(fulfilled=None, claimed_at=None, opened_at=now)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if not released:
             return jsonify({"error": "Not your commitment"}), 403
-        order.fulfilled = None
+        record_order_changes(db, [order.id], "unclaimed")
+        stats.record_unclaimed(db, [order])
+        reset_read_state(db, [order.id], user.id)
         db.commit()
     return jsonify({"success": True})
 
 
 @app.route("/complete-commitment", methods=["POST"])
 @cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(1, 10))
 def complete_commitment():
     if not is_authorized():
         return jsonify({"error": "Unauthorized"}), 401
@@ -355,19 +670,27 @@ def complete_commitment():
         order = db.query(Order).filter_by(id=order_id).first()
         if not order:
             return jsonify({"error": "Order not found"}), 404
-        if order.fulfilled != user.id:
+
+        # Delete order and items; RETURNING gives the row as it was removed for the stats
+        removed = db.execute(
+            delete(Order)
+            .where(Order.id == order.id, Order.fulfilled == user.id)
+            .returning(Order.id, Order.lat, Order.lng, Order.collectionDate, Order.fulfilled)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if not removed:
             return jsonify({"error": "Not your commitment"}), 403
-        
-        # Delete order and items
-        for item in db.query(OrderItem).filter_by(order_id=order.id).all():
-            db.delete(item)
-        db.delete(order)
+        db.execute(delete(OrderItem).where(OrderItem.order_id == order.id))
+        record_order_changes(db, [order.id], "removed")
+        stats.record_completed(db, [removed])
+        db.execute(delete(ChatReadState).where(ChatReadState.order_id == order.id))
         db.commit()
     return jsonify({"success": True})
 
 
 @app.route("/completed-request")
 @cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(1, 5))
 def delete_my_request():
     if not is_authorized():
         return jsonify({"error": "Unauthorized"}), 401
@@ -375,21 +698,152 @@ def delete_my_request():
     with Session(engine) as db:
         user = db.query(Account).filter_by(email=get_user_email()).first()
         order = db.query(Order).filter_by(account_id=user.id).first()
-        if order:
-            for item in db.query(OrderItem).filter_by(order_id=order.id).all():
-                db.delete(item)
+        # RETURNING gives the row as it was removed, so a claim that raced in is counted correctly
+        removed = db.execute(
+            delete(Order)
+            .where(Order.id == order.id)
+            .returning(Order.id, Order.lat, Order.lng, Order.collectionDate, Order.fulfilled)
+            .execution_options(synchronize_session=False)
+        ).first() if order else None
+        if removed:
+            db.execute(delete(OrderItem).where(OrderItem.order_id == order.id))
             # Delete associated messages
-            for msg in db.query(Message).filter_by(order_id=order.id).all():
-                db.delete(msg)
-            db.delete(order)
+            db.execute(delete(Message).where(Message.order_id == order.id))
+            record_order_changes(db, [order.id], "removed")
+            stats.record_completed(db, [removed])
+            db.execute(delete(ChatReadState).where(ChatReadState.order_id == order.id))
             db.commit()
             return jsonify({"success": True})
         return jsonify({"error": "Order not found"}), 404
 
 
+# Batch routes: each applies a list of order ids in one transaction and reports per-order results
+@app.route("/fulfil-requests", methods=["POST"])
+@cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(1, 10))
+def fulfil_requests():
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    order_ids = parse_order_ids(request.get_json())
+    if order_ids is None:
+        return jsonify({"error": f"order_ids must be a list of 1 to {MAX_BATCH_SIZE} ids"}), 400
+
+    now = datetime.now().isoformat()
+    with Session(engine) as db:
+        user = get_current_account(db)
+        found = {o.id: o for o in db.query(Order).filter(Order.id.in_(order_ids)).all()}
+
+        # The fulfilled check in the UPDATE stops two helpers claiming the same order
+        claimable = [o.id for o in found.values() if o.fulfilled is None]
+        claimed = set(db.execute(
+            update(Order)
+            .where(Order.id.in_(claimable), Order.fulfilled == None)
+            .values(fulfilled=user.id, claimed_at=now)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).scalars()) if claimable else set()
+
+        if claimed:
+            record_order_changes(db, sorted(claimed), "claimed")
+            stats.record_claimed(db, [found[order_id] for order_id in claimed], now)
+        db.commit()
+
+    return jsonify({"success": True, "results": batch_results(order_ids, found, claimed)})
+
+
+@app.route("/unfulfil-requests", methods=["POST"])
+@cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(1, 10))
+def unfulfil_requests():
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    order_ids = parse_order_ids(request.get_json())
+    if order_ids is None:
+        return jsonify({"error": f"order_ids must be a list of 1 to {MAX_BATCH_SIZE} ids"}), 400
+
+    now = datetime.now().isoformat()
+    with Session(engine) as db:
+        user = get_current_account(db)
+        found = {o.id: o for o in db.query(Order).filter(Order.id.in_(order_ids)).all()}
+
+        mine = [o.id for o in found.values() if o.fulfilled == user.id]
+        released = set(db.execute(
+            update(Order)
+            .where(Order.id.in_(mine), Order.fulfilled == user.id)
+            .values(fulfilled=None, claimed_at=None, opened_at=now)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).scalars()) if mine else set()
+
+        if released:
+            record_order_changes(db, sorted(released), "unclaimed")
+            stats.record_unclaimed(db, [found[order_id] for order_id in released])
+            reset_read_state(db, released, user.id)
+        db.commit()
+
+    return jsonify({"success": True, "results": batch_results(order_ids, found, released)})
+
+
+@app.route("/complete-commitments", methods=["POST"])
+@cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(1, 10))
+def complete_commitments():
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    order_ids = parse_order_ids(request.get_json())
+    if order_ids is None:
+        return jsonify({"error": f"order_ids must be a list of 1 to {MAX_BATCH_SIZE} ids"}), 400
+
+    with Session(engine) as db:
+        user = get_current_account(db)
+        found = {o.id: o for o in db.query(Order).filter(Order.id.in_(order_ids)).all()}
+
+        mine = [o.id for o in found.values() if o.fulfilled == user.id]
+        completed = set(db.execute(
+            delete(Order)
+            .where(Order.id.in_(mine), Order.fulfilled == user.id)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).scalars()) if mine else set()
+
+        if completed:
+            db.execute(delete(OrderItem).where(OrderItem.order_id.in_(completed)))
+            db.execute(delete(ChatReadState).where(ChatReadState.order_id.in_(completed)))
+            record_order_changes(db, sorted(completed), "removed")
+            stats.record_completed(db, [found[order_id] for order_id in completed])
+        db.commit()
+
+    return jsonify({"success": True, "results": batch_results(order_ids, found, completed)})
+
+
+# Stats routes
+@app.route("/stats")
+@cross_origin(supports_credentials=True)
+@admission.limit("read", per_user=(1, 5))
+def get_stats():
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    zoom = request.args.get("zoom", stats.MAX_ZOOM, type=int)
+    if not 0 <= zoom <= stats.MAX_ZOOM:
+        return jsonify({"error": f"zoom must be between 0 and {stats.MAX_ZOOM}"}), 400
+    try:
+        date_from = parse_date(request.args["from"]) if "from" in request.args else None
+        date_to = parse_date(request.args["to"]) if "to" in request.args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with Session(engine) as db:
+        return jsonify(stats.load_stats(db, zoom, date_from, date_to))
+
+
 # Chat routes
 @app.route("/messages/<int:order_id>")
 @cross_origin(supports_credentials=True)
+@admission.limit("poll", per_user=(1, 5))
 def get_messages(order_id):
     if not is_authorized():
         return jsonify({"error": "Unauthorized"}), 401
@@ -419,24 +873,34 @@ def get_messages(order_id):
 
         # Get other user info
         other_user = None
+        other_id = None
         if order.account_id == user.id and order.fulfilled:
+            other_id = order.fulfilled
             helper = db.query(Account).filter_by(id=order.fulfilled).first()
             if helper:
                 other_user = {"name": helper.email.split('@')[0].title(), "email": helper.email}
         elif order.fulfilled == user.id:
+            other_id = order.account_id
             requester = db.query(Account).filter_by(id=order.account_id).first()
             if requester:
                 other_user = {"name": requester.email.split('@')[0].title(), "email": requester.email}
 
+        # Read receipt: the last message the other participant has seen
+        other_last_read = db.query(ChatReadState.last_read_message_id).filter_by(
+            order_id=order_id, account_id=other_id
+        ).scalar() if other_id else None
+
         return jsonify({
             "messages": messages_list,
             "other_user": other_user,
+            "other_last_read_id": other_last_read,
             "order_id": order_id
         })
 
 
 @app.route("/send-message", methods=["POST"])
 @cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(1, 5), total=(50, 100))
 def send_message():
     if not is_authorized():
         return jsonify({"error": "Unauthorized"}), 401
@@ -465,6 +929,13 @@ def send_message():
             timestamp=datetime.now().isoformat()
         )
         db.add(msg)
+        db.flush()
+
+        # Keep unread counters current so the chat list never scans message history
+        recipient_id = order.fulfilled if order.account_id == user.id else order.account_id
+        if recipient_id and recipient_id != user.id:
+            bump_unread(db, order_id, recipient_id)
+        mark_read_up_to(db, order_id, user.id, msg.id)
         db.commit()
 
         return jsonify({
@@ -481,6 +952,7 @@ def send_message():
 
 @app.route("/my-chats")
 @cross_origin(supports_credentials=True)
+@admission.limit("read")
 def get_my_chats():
     if not is_authorized():
         return jsonify({"error": "Unauthorized"}), 401
@@ -491,52 +963,136 @@ def get_my_chats():
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        chats = []
-        
-        # Requests I made with a helper assigned
-        my_requests = db.query(Order).filter(
-            Order.account_id == user.id,
-            Order.fulfilled != None
-        ).all()
-        
-        for order in my_requests:
-            helper = db.query(Account).filter_by(id=order.fulfilled).first()
-            last_msg = db.query(Message).filter_by(order_id=order.id).order_by(Message.timestamp.desc()).first()
-            helper_name = helper.email.split('@')[0].title() if helper else "Unknown"
-            
-            chats.append({
-                "order_id": order.id,
-                "role": "requester",
-                "other_user": {"name": helper_name, "email": helper.email if helper else ""},
-                "address": order.address,
-                "last_message": {
-                    "content": last_msg.content,
-                    "timestamp": last_msg.timestamp,
-                    "is_mine": last_msg.sender_email == email
-                } if last_msg else None
-            })
-
-        # Orders I'm helping with
-        my_commitments = db.query(Order).filter_by(fulfilled=user.id).all()
-        
-        for order in my_commitments:
-            requester = db.query(Account).filter_by(id=order.account_id).first()
-            last_msg = db.query(Message).filter_by(order_id=order.id).order_by(Message.timestamp.desc()).first()
-            requester_name = requester.email.split('@')[0].title() if requester else "Unknown"
-            
-            chats.append({
-                "order_id": order.id,
-                "role": "helper",
-                "other_user": {"name": requester_name, "email": requester.email if requester else ""},
-                "address": order.address,
-                "last_message": {
-                    "content": last_msg.content,
-                    "timestamp": last_msg.timestamp,
-                    "is_mine": last_msg.sender_email == email
-                } if last_msg else None
-            })
-
-        return jsonify({"chats": chats})
+        chats = load_chat_summaries(db, user, email)
+        return jsonify({"chats": chats, "total_unread": sum(c["unread"] for c in chats)})
+
+
+@app.route("/unread-count")
+@cross_origin(supports_credentials=True)
+@admission.limit("poll", per_user=(1, 5))
+def get_unread_count():
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    with Session(engine) as db:
+        user = get_current_account(db)
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        total = db.query(func.sum(ChatReadState.unread_count)).filter_by(account_id=user.id).scalar()
+        return jsonify({"total_unread": total or 0})
+
+
+@app.route("/mark-read", methods=["POST"])
+@cross_origin(supports_credentials=True)
+@admission.limit("write", per_user=(2, 10))
+def mark_read():
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json() or {}
+    order_id = data.get("order_id")
+    message_id = data.get("message_id")
+    if not order_id or not isinstance(message_id, int):
+        return jsonify({"error": "Missing data"}), 400
+
+    with Session(engine) as db:
+        user = get_current_account(db)
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+        if not db.query(Message.id).filter_by(id=message_id, order_id=order_id).first():
+            return jsonify({"error": "Message not found"}), 404
+
+        # Mark read only up to what the client has shown, never moving the cursor backwards, and
+        # recount what is still unread above it so messages that arrived meanwhile stay unread.
+        # Only ever touches the caller's own cursor, which exists once they have received a message.
+        cursor = case(
+            (ChatReadState.last_read_message_id > message_id, ChatReadState.last_read_message_id),
+            else_=message_id
+        )
+        still_unread = db.query(func.count(Message.id)).filter(
+            Message.order_id == order_id,
+            Message.sender_email != user.email,
+            Message.id > cursor
+        ).scalar_subquery()
+        db.query(ChatReadState).filter_by(order_id=order_id, account_id=user.id).update(
+            {ChatReadState.last_read_message_id: cursor, ChatReadState.unread_count: still_unread},
+            synchronize_session=False
+        )
+        db.commit()
+    return jsonify({"success": True})
+
+
+# Admin routes
+@app.route("/admin/export/<table>")
+@cross_origin(supports_credentials=True)
+@admission.limit("poll", per_user=(0.1, 2))
+def admin_export(table):
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if not is_admin():
+        return jsonify({"error": "Access denied"}), 403
+
+    fmt = request.args.get("format", "ndjson")
+    if table not in EXPORT_TABLES or fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "Unknown table or format"}), 400
+    try:
+        filters = {
+            "date_from": parse_date(request.args["from"]) if "from" in request.args else None,
+            "date_to": parse_date(request.args["to"]) if "to" in request.args else None,
+            "region": parse_region(request.args["region"]) if "region" in request.args else None,
+            "after": request.args.get("after", 0, type=int)
+        }
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(
+        stream_with_context(export_lines(table, fmt, **filters)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={table}.{fmt}"}
+    )
+
+
+@app.route("/admin/metrics")
+@cross_origin(supports_credentials=True)
+def admin_metrics():
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if not is_admin():
+        return jsonify({"error": "Access denied"}), 403
+    return jsonify({"admission": admission.snapshot()})
+
+
+@app.route("/admin/profiles")
+@cross_origin(supports_credentials=True)
+def admin_profiles():
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if not is_admin():
+        return jsonify({"error": "Access denied"}), 403
+    if profiler is None:
+        return jsonify({"error": "Profiling is off, set PROFILE_SAMPLE_RATE to enable it"}), 404
+    return jsonify(profiler.summary())
+
+
+@app.route("/admin/profiles/<endpoint>")
+@cross_origin(supports_credentials=True)
+def admin_profile(endpoint):
+    if not is_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if not is_admin():
+        return jsonify({"error": "Access denied"}), 403
+    if profiler is None:
+        return jsonify({"error": "Profiling is off, set PROFILE_SAMPLE_RATE to enable it"}), 404
+
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "calls"):
+        return jsonify({"error": "sort must be cumulative, tottime or calls"}), 400
+    report = profiler.top_functions(endpoint, sort=sort)
+    if report is None:
+        return jsonify({"error": "No samples for this endpoint"}), 404
+    return Response(report, mimetype="text/plain")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+"""
+Demand aggregates behind the /stats endpoint.
+
+Orders are bucketed into a fixed lat/lng grid. DemandCell and DemandItem count activity per
+day, and DemandOpen counts unclaimed requests per collection date so expired ones can be left
+out when read. All of them are bumped in the same transaction as each create, claim, unclaim
+and completion, so reading them never scans the order tables. Run this script to check that
+they still agree with the raw tables, or to rebuild the open counts from them:
+
+    python stats.py verify
+    python stats.py rebuild
+
+Activity history can't be recovered for orders that have been completed or deleted, so
+`rebuild --all`, which also recomputes DemandCell and DemandItem from the orders still in the
+database, drops that history; only use it on a database whose aggregates are beyond repair.
+"""
+import math
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session
+from models import engine, dialect_insert, Order, OrderItem, DemandCell, DemandOpen, DemandItem
+
+GRID_SIZE = 0.01  # Degrees per base cell, roughly 1km across the UK
+MAX_ZOOM = 6  # Each zoom level below this merges 2x2 cells
+TOP_ITEMS = 10
+
+
+def cell_for(lat, lng):
+    """Base grid cell for a point; offset so indexes are never negative and integer division rolls up cleanly."""
+    try:
+        return int(math.floor((float(lng) + 180) / GRID_SIZE)), int(math.floor((float(lat) + 90) / GRID_SIZE))
+    except (TypeError, ValueError):
+        return None
+
+
+def seconds_between(start, end):
+    try:
+        return max(0, int((datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()))
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_deltas(db, model, deltas):
+    """Add counter deltas keyed by (field, value) tuples, inserting rows for unseen keys.
+
+    One multi-row INSERT ... ON CONFLICT DO UPDATE per call, however many keys there are.
+    """
+    if not deltas:
+        return
+    conflict = [field for field, _ in next(iter(deltas))]
+    fields = sorted({field for counts in deltas.values() for field in counts})
+    # Sorted so concurrent writers lock rows in the same order
+    rows = [{**dict(key), **{field: counts.get(field, 0) for field in fields}} for key, counts in sorted(deltas.items())]
+    insert = dialect_insert(model).values(rows)
+    db.execute(insert.on_conflict_do_update(
+        index_elements=conflict,
+        set_={field: getattr(model, field) + insert.excluded[field] for field in fields}
+    ))
+
+
+def cell_deltas(orders, day, **counts):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for order in orders:
+        cell = cell_for(order.lat, order.lng)
+        if cell is None:
+            continue
+        key = (("cell_x", cell[0]), ("cell_y", cell[1]), ("day", day))
+        for field, n in counts.items():
+            deltas[key][field] += n(order) if callable(n) else n
+    return deltas
+
+
+def open_deltas(orders, n):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for order in orders:
+        cell = cell_for(order.lat, order.lng)
+        if cell is None:
+            continue
+        key = (("cell_x", cell[0]), ("cell_y", cell[1]), ("collection_date", order.collectionDate or ""))
+        deltas[key]["open_count"] += n
+    return deltas
+
+
+def today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def unexpired(column):
+    # Matches the map: orders without a collection date never expire
+    return or_(column == "", column >= today())
+
+
+# Event hooks, called by the routes before they commit. `orders` can be ORM objects or rows from
+# UPDATE/DELETE ... RETURNING, as long as they carry the columns each hook reads.
+def record_created(db, orders, items):
+    """`items` maps order id to a list of {"name", "quantity"} dicts, already validated."""
+    day = today()
+    apply_deltas(db, DemandCell, cell_deltas(orders, day, created=1))
+    apply_deltas(db, DemandOpen, open_deltas(orders, 1))
+
+    item_deltas = defaultdict(lambda: defaultdict(int))
+    for order in orders:
+        for item in items.get(order.id, []):
+            key = (("name", item["name"].strip().capitalize()), ("day", day))
+            item_deltas[key]["requests"] += 1
+            item_deltas[key]["quantity"] += item["quantity"]
+    apply_deltas(db, DemandItem, item_deltas)
+
+
+def record_claimed(db, orders, claimed_at):
+    """Call with the orders as they were before the claim, so `opened_at` is when they last became claimable."""
+    def wait(order):
+        # Unknown for orders from before opened_at existed; those count as claims but stay out of the mean
+        return seconds_between(order.opened_at, claimed_at)
+
+    apply_deltas(db, DemandCell, cell_deltas(
+        orders, today(),
+        claimed=1,
+        timed_claims=lambda order: 0 if wait(order) is None else 1,
+        claim_seconds=lambda order: wait(order) or 0
+    ))
+    apply_deltas(db, DemandOpen, open_deltas(orders, -1))
+
+
+def record_unclaimed(db, orders):
+    apply_deltas(db, DemandOpen, open_deltas(orders, 1))
+
+
+def record_completed(db, orders):
+    """Call with the orders as they were deleted (e.g. DELETE ... RETURNING rows), so ones still open are closed too."""
+    apply_deltas(db, DemandCell, cell_deltas(orders, today(), completed=1))
+    apply_deltas(db, DemandOpen, open_deltas([order for order in orders if order.fulfilled is None], -1))
+
+
+# Reads
+def load_stats(db, zoom=MAX_ZOOM, date_from=None, date_to=None):
+    """Open requests and activity per cell at the given zoom, plus top items and mean time-to-claim.
+
+    Open counts are current (unclaimed orders whose collection date hasn't passed, as on the map);
+    the activity counts cover the requested date range.
+    """
+    factor = 2 ** (MAX_ZOOM - zoom)
+    conditions = []
+    if date_from:
+        conditions.append(DemandCell.day >= date_from)
+    if date_to:
+        conditions.append(DemandCell.day <= date_to)
+
+    def ranged(column):
+        return func.sum(case((and_(*conditions), column), else_=0)) if conditions else func.sum(column)
+
+    x = (DemandCell.cell_x // factor).label("x")
+    y = (DemandCell.cell_y // factor).label("y")
+    activity = {
+        (cx, cy): counts
+        for cx, cy, *counts in db.query(
+            x, y,
+            ranged(DemandCell.created),
+            ranged(DemandCell.claimed),
+            ranged(DemandCell.completed),
+            ranged(DemandCell.timed_claims),
+            ranged(DemandCell.claim_seconds)
+        ).group_by(x, y)
+    }
+
+    ox = (DemandOpen.cell_x // factor).label("x")
+    oy = (DemandOpen.cell_y // factor).label("y")
+    open_counts = dict(
+        ((cx, cy), open_count)
+        for cx, cy, open_count in db.query(ox, oy, func.sum(DemandOpen.open_count))
+        .filter(unexpired(DemandOpen.collection_date))
+        .group_by(ox, oy)
+    )
+
+    cell_size = GRID_SIZE * factor
+    cells = []
+    total_timed_claims = total_claim_seconds = 0
+    for cx, cy in sorted(set(activity) | set(open_counts)):
+        created, claimed, completed, timed_claims, claim_seconds = activity.get((cx, cy), (0, 0, 0, 0, 0))
+        open_count = open_counts.get((cx, cy), 0)
+        if not (open_count or created or claimed or completed):
+            continue
+        total_timed_claims += timed_claims
+        total_claim_seconds += claim_seconds
+        cells.append({
+            "lat": round(cy * cell_size - 90 + cell_size / 2, 6),
+            "lng": round(cx * cell_size - 180 + cell_size / 2, 6),
+            "open": open_count,
+            "created": created,
+            "claimed": claimed,
+            "completed": completed,
+            "mean_claim_minutes": round(claim_seconds / timed_claims / 60, 1) if timed_claims else None
+        })
+
+    item_query = db.query(DemandItem.name, func.sum(DemandItem.quantity), func.sum(DemandItem.requests))
+    if date_from:
+        item_query = item_query.filter(DemandItem.day >= date_from)
+    if date_to:
+        item_query = item_query.filter(DemandItem.day <= date_to)
+    top_items = item_query.group_by(DemandItem.name).order_by(func.sum(DemandItem.quantity).desc()).limit(TOP_ITEMS)
+
+    return {
+        "zoom": zoom,
+        "cell_size": cell_size,
+        "cells": cells,
+        "top_items": [{"name": name, "quantity": quantity, "requests": requests} for name, quantity, requests in top_items],
+        "open": sum(c["open"] for c in cells),
+        "mean_claim_minutes": round(total_claim_seconds / total_timed_claims / 60, 1) if total_timed_claims else None
+    }
+
+
+# Maintenance
+def rebuild_open(db):
+    """Recompute the open counts from the unclaimed orders. Nothing is lost: they only describe live orders."""
+    counts = Counter()
+    for lat, lng, collection_date in db.query(Order.lat, Order.lng, Order.collectionDate).filter(
+        Order.fulfilled == None
+    ).yield_per(1000):
+        cell = cell_for(lat, lng)
+        if cell is not None:
+            counts[(cell[0], cell[1], collection_date or "")] += 1
+
+    db.query(DemandOpen).delete()
+    db.add_all(DemandOpen(cell_x=x, cell_y=y, collection_date=date, open_count=n) for (x, y, date), n in counts.items())
+    db.commit()
+    return len(counts)
+
+
+def rebuild_history(db):
+    """Recompute the activity counts from the orders and items still in the database.
+
+    Completed orders are deleted, so their history is lost; only use this when `verify` reports
+    drift that can't be fixed any other way.
+    """
+    fallback_day = today()
+    cells = defaultdict(lambda: defaultdict(int))
+    orders = {}
+    for order in db.query(Order).yield_per(1000):
+        created_day = (order.created_at or fallback_day)[:10]
+        orders[order.id] = created_day
+        cell = cell_for(order.lat, order.lng)
+        if cell is None:
+            continue
+        cells[(cell[0], cell[1], created_day)]["created"] += 1
+        if order.fulfilled is not None:
+            key = (cell[0], cell[1], (order.claimed_at or order.created_at or fallback_day)[:10])
+            cells[key]["claimed"] += 1
+            wait = seconds_between(order.opened_at, order.claimed_at)
+            if wait is not None:
+                cells[key]["timed_claims"] += 1
+                cells[key]["claim_seconds"] += wait
+
+    items = defaultdict(lambda: defaultdict(int))
+    for item in db.query(OrderItem).yield_per(1000):
+        if item.order_id in orders:
+            key = (item.name.strip().capitalize(), orders[item.order_id])
+            items[key]["requests"] += 1
+            items[key]["quantity"] += item.quantity
+
+    db.query(DemandCell).delete()
+    db.query(DemandItem).delete()
+    db.add_all(DemandCell(cell_x=x, cell_y=y, day=day, **counts) for (x, y, day), counts in cells.items())
+    db.add_all(DemandItem(name=name, day=day, **counts) for (name, day), counts in items.items())
+    db.commit()
+    return len(cells), len(items)
+
+
+def verify(db):
+    """Compare the aggregates against the order table, returning (check, key, expected, actual) for each disagreement.
+
+    "open" compares unexpired, unclaimed orders per base cell with the open counts. "created" checks
+    that each (cell x, cell y, day) counts at least the live orders created then; it can be higher,
+    since completed orders are deleted but stay counted.
+    """
+    mismatches = []
+
+    expected_open = Counter()
+    for lat, lng in db.query(Order.lat, Order.lng).filter(
+        Order.fulfilled == None,
+        or_(Order.collectionDate == None, unexpired(Order.collectionDate))
+    ).yield_per(1000):
+        cell = cell_for(lat, lng)
+        if cell is not None:
+            expected_open[cell] += 1
+
+    actual_open = {
+        (x, y): open_count
+        for x, y, open_count in db.query(DemandOpen.cell_x, DemandOpen.cell_y, func.sum(DemandOpen.open_count))
+        .filter(unexpired(DemandOpen.collection_date))
+        .group_by(DemandOpen.cell_x, DemandOpen.cell_y)
+    }
+    for cell in set(expected_open) | set(actual_open):
+        if expected_open.get(cell, 0) != actual_open.get(cell, 0):
+            mismatches.append(("open", cell, expected_open.get(cell, 0), actual_open.get(cell, 0)))
+
+    live_created = Counter()
+    for lat, lng, created_at in db.query(Order.lat, Order.lng, Order.created_at).filter(
+        Order.created_at != None
+    ).yield_per(1000):
+        cell = cell_for(lat, lng)
+        if cell is not None:
+            live_created[(cell[0], cell[1], created_at[:10])] += 1
+
+    actual_created = {
+        (x, y, day): created
+        for x, y, day, created in db.query(DemandCell.cell_x, DemandCell.cell_y, DemandCell.day, DemandCell.created)
+    }
+    for key, n in live_created.items():
+        if actual_created.get(key, 0) < n:
+            mismatches.append(("created", key, n, actual_created.get(key, 0)))
+    return mismatches
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    with Session(engine) as db:
+        if command == "rebuild":
+            if "--all" in sys.argv[2:]:
+                cell_rows, item_rows = rebuild_history(db)
+                print(f"Rebuilt {cell_rows} activity rows and {item_rows} item rows (history of deleted orders dropped).")
+            print(f"Rebuilt {rebuild_open(db)} open count rows.")
+            command = "verify"
+        if command == "verify":
+            mismatches = verify(db)
+            for check, key, expected, actual in sorted(mismatches):
+                if check == "open":
+                    print(f"  cell {key}: {expected} open orders, aggregates say {actual}")
+                else:
+                    print(f"  cell {key[:2]} on {key[2]}: {expected} live orders created, aggregates say only {actual}")
+            print(f"{len(mismatches)} disagreements with the order table." if mismatches else "Aggregates are consistent.")
+            sys.exit(1 if mismatches else 0)
+        print("Usage: python stats.py verify|rebuild [--all]")
+        sys.exit(2)
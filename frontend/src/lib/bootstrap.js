@@ -0,0 +1,25 @@
+import { API_URL } from '$lib/config';
+
+const MAX_RETRY_SECONDS = 30;
+
+/**
+ * Load /bootstrap for a page. When the server sheds the request (429/503) this waits for
+ * Retry-After and tries again, calling onBusy(seconds) first so the page can say so. A shed
+ * response says nothing about the session, so it must never send the user to log in.
+ * Resolves to the response body; throws on any other failure.
+ */
+export async function fetchBootstrap(page, onBusy = () => {}) {
+	for (;;) {
+		const response = await fetch(`${API_URL}/bootstrap?page=${page}`, { credentials: 'include' });
+		if (response.status === 429 || response.status === 503) {
+			const seconds = Math.min(parseInt(response.headers.get('Retry-After'), 10) || 2, MAX_RETRY_SECONDS);
+			onBusy(seconds);
+			await new Promise((resolve) => setTimeout(resolve, seconds * 1000));
+			continue;
+		}
+		if (!response.ok) {
+			throw new Error(`Bootstrap failed with status ${response.status}`);
+		}
+		return response.json();
+	}
+}